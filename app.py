@@ -1,18 +1,162 @@
+import hashlib
+import os
+
 import streamlit as st
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import matplotlib.pyplot as plt
 
 # === CONFIG ===
-@st.cache_data
-def load_data(default_path):
+UNUSED_COLS = ("industries_clean",)
+CSV_DTYPES = {
+    "gpt_industry": "category",
+    "location_clean": "category",
+    "Aggregated Location": "category",
+    "state": "category",
+    "city": "category",
+    "primary_role": "category",
+}
+
+def read_csv(source):
+    # Peek at the header so unused columns are skipped and dtypes are only set for columns that exist.
+    header = pd.read_csv(source, nrows=0).columns
+    if hasattr(source, "seek"):
+        source.seek(0)
+    df = pd.read_csv(
+        source,
+        engine="pyarrow",
+        dtype_backend="pyarrow",
+        usecols=[c for c in header if c not in UNUSED_COLS],
+        dtype={c: t for c, t in CSV_DTYPES.items() if c in header},
+    )
+    # Downcast pool_size only when it parsed as integers that fit; fractional sizes stay as floats.
+    if "pool_size" in df.columns and pd.api.types.is_integer_dtype(df["pool_size"]):
+        sizes = df["pool_size"].dropna().to_numpy()
+        int32_info = np.iinfo(np.int32)
+        if not sizes.size or (sizes.min() >= int32_info.min and sizes.max() <= int32_info.max):
+            df["pool_size"] = df["pool_size"].astype("int32[pyarrow]")
+    return df
+
+def prepare(df):
+    # Rename location column if needed
+    if "Aggregated Location" in df.columns and "location_clean" not in df.columns:
+        df = df.rename(columns={"Aggregated Location": "location_clean"})
+
+    # Format PC Link column
+    if "PC URL" in df.columns:
+        pc_urls = df["PC URL"].astype("string")
+        df = df.assign(**{"PC Link": pc_urls.where(pc_urls.str.startswith("http", na=False), "")})
+
+    # Drop unused columns
+    df = df.drop(columns=[c for c in ("industries_clean", "PC URL") if c in df.columns])
+
+    # Categorical columns
+    df = df.astype({c: "category" for c in ("gpt_industry", "location_clean", "state", "city", "primary_role") if c in df.columns})
+
+    return df
+
+def read_parquet(path):
+    # Dictionary columns come back as pandas categoricals; casting Arrow dictionaries with nulls fails.
+    table = pq.read_table(path)
+    return table.to_pandas(types_mapper=lambda t: None if pa.types.is_dictionary(t) else pd.ArrowDtype(t))
+
+@st.cache_data(max_entries=4)
+def load_data(default_path, modified_time):
+    # modified_time only keys the cache, so an updated CSV is re-imported without a restart.
+    parquet_path = default_path + ".parquet"
     try:
-        return pd.read_csv(default_path)
+        if os.path.exists(parquet_path) and (
+            not os.path.exists(default_path) or os.path.getmtime(parquet_path) >= os.path.getmtime(default_path)
+        ):
+            # Any failure reading or preparing the sidecar falls back to the CSV, which then rewrites it.
+            try:
+                return prepare(read_parquet(parquet_path))
+            except Exception as e:
+                st.warning(f"Could not use Parquet cache `{parquet_path}`, re-importing the CSV: {e}")
+        df = read_csv(default_path)
+        tmp_path = parquet_path + ".tmp"
+        try:
+            df.to_parquet(tmp_path, engine="pyarrow", compression="snappy", index=False)
+            os.replace(tmp_path, parquet_path)
+        except (OSError, pa.ArrowException) as e:
+            st.warning(f"Could not write Parquet cache `{parquet_path}`: {e}")
+        return prepare(df)
     except Exception as e:
         st.error(f"Error loading default file: {e}")
         return pd.DataFrame()
 
+@st.cache_data(max_entries=20)
+def compute_filter_options(_df, data_key, column, split=False):
+    # data_key identifies the unhashed _df, so edited uploads always get fresh options.
+    values = _df[column].dropna().astype(str)
+    if split:
+        values = values.str.split(",").explode().str.strip()
+    return sorted(values.unique())
+
+@st.cache_data(max_entries=32)
+def filter_positions(_df, data_key, roles, industries, locations, states, cities):
+    # Only row positions are cached; cache hits unpickle a copy, so returning frames would copy them every rerun.
+    # _df is unhashed: data_key identifies the dataset, since sampled frame hashes can collide.
+    df = _df
+    mask = np.ones(len(df), dtype=bool)
+
+    if roles:
+        # Plain substring matches (like `role in x`); avoids RE2 escaping rules on Arrow-backed strings.
+        role_mask = np.zeros(len(df), dtype=bool)
+        for role in roles:
+            role_mask |= df["cleaned_roles"].str.contains(role, na=False, regex=False).to_numpy(dtype=bool)
+        mask &= role_mask
+    if industries:
+        mask &= df["gpt_industry"].isin(industries).to_numpy(dtype=bool)
+    if locations:
+        mask &= df["location_clean"].isin(locations).to_numpy(dtype=bool)
+    if states:
+        mask &= df["state"].isin(states).to_numpy(dtype=bool)
+    if cities:
+        mask &= df["city"].isin(cities).to_numpy(dtype=bool)
+
+    return None if mask.all() else np.flatnonzero(mask)
+
+@st.cache_data(max_entries=32)
+def sort_order(_df, view_key, column, ascending):
+    # view_key (dataset key plus filter selection) identifies the unhashed _df.
+    values = _df[column]
+    if pd.api.types.is_numeric_dtype(values) and not values.hasnans:
+        values = values.to_numpy()
+        if ascending:
+            return np.argsort(values, kind="stable")
+        # Stable descending: sort the reversed array, then map positions back.
+        return len(values) - 1 - np.argsort(values[::-1], kind="stable")[::-1]
+    return values.reset_index(drop=True).sort_values(ascending=ascending, kind="stable").index.to_numpy()
+
+def category_counts(values):
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        return values.value_counts()
+    codes = values.cat.codes.to_numpy()
+    counts = pd.Series(
+        np.bincount(codes[codes >= 0], minlength=len(values.cat.categories)),
+        index=pd.Index(values.cat.categories, name=values.name),
+        name="count",
+    )
+    return counts[counts > 0].sort_values(ascending=False)
+
+@st.cache_data(max_entries=4)
+def to_csv_bytes(_df, view_key):
+    # view_key (dataset key, filter selection and sort) identifies the unhashed _df.
+    return _df.to_csv(index=False).encode("utf-8")
+
+@st.cache_data(max_entries=4)
+def load_upload(_uploaded_file, file_digest):
+    # Keyed on a digest of the upload: Streamlit's DataFrame hash samples large frames and misses edits.
+    return prepare(read_csv(_uploaded_file))
+
 # === Default CSV file ===
-default_file_path = "/Users/bharatkumar/Downloads/icp_segments_final.csv"
+default_file_path = os.environ.get("ICP_DEFAULT_FILE", "/Users/bharatkumar/Downloads/icp_segments_final.csv")
+
+# === Rows rendered in the data table before the "Rows to show" slider appears ===
+DISPLAY_ROW_LIMIT = 1000
 
 # === Streamlit Page Setup ===
 st.set_page_config(page_title="ICP Segment Explorer", layout="wide")
@@ -23,10 +167,17 @@ st.sidebar.markdown("### 📁 Load Data")
 uploaded_file = st.sidebar.file_uploader("Upload a CSV to override the default", type=["csv"])
 
 if uploaded_file:
-    df = pd.read_csv(uploaded_file)
-    st.success("✅ Loaded uploaded file.")
+    data_key = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    try:
+        df = load_upload(uploaded_file, data_key)
+        st.success("✅ Loaded uploaded file.")
+    except Exception as e:
+        st.error(f"Error loading uploaded file: {e}")
+        df = pd.DataFrame()
 else:
-    df = load_data(default_file_path)
+    modified_time = os.path.getmtime(default_file_path) if os.path.exists(default_file_path) else None
+    data_key = f"{default_file_path}@{modified_time}"
+    df = load_data(default_file_path, modified_time)
     st.info(f"Using default file: `{default_file_path}`")
 
 if df.empty:
@@ -34,24 +185,14 @@ if df.empty:
 
 st.markdown(f"Loaded {len(df):,} ICP records.")
 
-# === Rename Location Column if Needed ===
-if "Aggregated Location" in df.columns and "location_clean" not in df.columns:
-    df.rename(columns={"Aggregated Location": "location_clean"}, inplace=True)
-
 # === Filters ===
 st.sidebar.header("🔍 Filters")
 
-unique_roles = sorted(set(
-    role.strip() for roles in df["cleaned_roles"].dropna().astype(str) for role in roles.split(",")
-)) if "cleaned_roles" in df.columns else []
-
-unique_industries = sorted(set(
-    ind.strip() for inds in df["gpt_industry"].dropna().astype(str) for ind in inds.split(",")
-)) if "gpt_industry" in df.columns else []
-
-unique_locations = sorted(df["location_clean"].dropna().astype(str).unique()) if "location_clean" in df.columns else []
-unique_states = sorted(df["state"].dropna().astype(str).unique()) if "state" in df.columns else []
-unique_cities = sorted(df["city"].dropna().astype(str).unique()) if "city" in df.columns else []
+unique_roles = compute_filter_options(df, data_key, "cleaned_roles", split=True) if "cleaned_roles" in df.columns else []
+unique_industries = compute_filter_options(df, data_key, "gpt_industry", split=True) if "gpt_industry" in df.columns else []
+unique_locations = compute_filter_options(df, data_key, "location_clean") if "location_clean" in df.columns else []
+unique_states = compute_filter_options(df, data_key, "state") if "state" in df.columns else []
+unique_cities = compute_filter_options(df, data_key, "city") if "city" in df.columns else []
 
 selected_roles = st.sidebar.multiselect("Filter by Role", unique_roles)
 selected_industries = st.sidebar.multiselect("Filter by GPT Industry", unique_industries)
@@ -60,31 +201,16 @@ selected_states = st.sidebar.multiselect("Filter by State", unique_states)
 selected_cities = st.sidebar.multiselect("Filter by City", unique_cities)
 
 # === Filtering Logic ===
-filtered_df = df.copy()
-
-if selected_roles:
-    filtered_df = filtered_df[filtered_df["cleaned_roles"].apply(
-        lambda x: isinstance(x, str) and any(role in x for role in selected_roles)
-    )]
-if selected_industries:
-    filtered_df = filtered_df[filtered_df["gpt_industry"].isin(selected_industries)]
-if selected_locations:
-    filtered_df = filtered_df[filtered_df["location_clean"].isin(selected_locations)]
-if selected_states:
-    filtered_df = filtered_df[filtered_df["state"].isin(selected_states)]
-if selected_cities:
-    filtered_df = filtered_df[filtered_df["city"].isin(selected_cities)]
-
-# === Drop columns ===
-if "industries_clean" in filtered_df.columns:
-    filtered_df.drop(columns=["industries_clean"], inplace=True)
-
-# === Format PC Link Column ===
-if "PC URL" in filtered_df.columns:
-    filtered_df["PC Link"] = filtered_df["PC URL"].apply(
-        lambda x: x if pd.notna(x) and x.startswith("http") else ""
-    )
-    filtered_df.drop(columns=["PC URL"], inplace=True)
+selection = (
+    tuple(selected_roles),
+    tuple(selected_industries),
+    tuple(selected_locations),
+    tuple(selected_states),
+    tuple(selected_cities),
+)
+positions = filter_positions(df, data_key, *selection)
+view_key = (data_key, selection)
+filtered_df = df if positions is None else df.iloc[positions]
 
 # === Sorting ===
 st.sidebar.header("🔢 Sort")
@@ -94,42 +220,51 @@ sort_column = st.sidebar.selectbox(
     index=list(filtered_df.columns).index("pool_size") if "pool_size" in filtered_df.columns else 0
 )
 sort_ascending = st.sidebar.radio("Sort order", ["Ascending", "Descending"]) == "Ascending"
-filtered_df = filtered_df.sort_values(by=sort_column, ascending=sort_ascending)
+filtered_df = filtered_df.iloc[sort_order(filtered_df, view_key, sort_column, sort_ascending)]
+
+# === Charts ===
+st.sidebar.header("📊 Charts")
+show_charts = st.sidebar.checkbox("Show charts", value=False)
 
 # === Display Filtered Data ===
 st.subheader("📈 Filtered Data")
-st.dataframe(filtered_df, use_container_width=True)
+rows_to_show = len(filtered_df)
+if rows_to_show > DISPLAY_ROW_LIMIT:
+    rows_to_show = st.slider("Rows to show", DISPLAY_ROW_LIMIT, len(filtered_df), DISPLAY_ROW_LIMIT)
+    st.caption(f"Showing {rows_to_show:,} of {len(filtered_df):,} rows. The download includes all rows.")
+st.dataframe(filtered_df.head(rows_to_show), use_container_width=True)
 
 # === Summary Stats for Pool Size ===
 if "pool_size" in filtered_df.columns:
     st.markdown("### 📊 Summary Statistics for Pool Size")
-    st.write("**Mean Pool Size:**", int(filtered_df["pool_size"].mean()))
-    st.write("**Median Pool Size:**", int(filtered_df["pool_size"].median()))
-    mode_val = filtered_df["pool_size"].mode()
-    if not mode_val.empty:
-        st.write("**Mode Pool Size:**", int(mode_val.iloc[0]))
-    st.bar_chart(filtered_df["pool_size"].value_counts().sort_index())
+    pool_sizes = filtered_df["pool_size"].dropna().to_numpy()
+    if pool_sizes.size:
+        # np.unique sorts once and yields both the histogram and the (smallest) mode.
+        pool_values, pool_counts = np.unique(pool_sizes, return_counts=True)
+        st.write("**Mean Pool Size:**", int(pool_sizes.mean()))
+        st.write("**Median Pool Size:**", int(np.median(pool_sizes)))
+        st.write("**Mode Pool Size:**", int(pool_values[pool_counts.argmax()]))
+        if show_charts:
+            st.bar_chart(pd.Series(pool_counts, index=pd.Index(pool_values, name="pool_size"), name="count"))
 
 # === GPT Summary (optional) ===
 if "gpt_industry" in filtered_df.columns:
     st.markdown("### 🧠 GPT-Inferred Industries Breakdown")
     st.dataframe(
-        filtered_df["gpt_industry"]
-        .value_counts()
+        category_counts(filtered_df["gpt_industry"])
         .rename_axis("GPT Industry")
         .reset_index(name="Count")
     )
 
 # === Top Roles by Location Chart ===
-if "primary_role" in df.columns and "location_clean" in df.columns:
+if show_charts and "primary_role" in df.columns and "location_clean" in df.columns:
     st.markdown("### 📊 Top Roles in Selected Locations")
-    chart_data = (
-        filtered_df.groupby(["location_clean", "primary_role"])
-        .size()
-        .reset_index(name="Count")
-    )
-    if not chart_data.empty:
-        top_roles = chart_data.sort_values("Count", ascending=False).head(20)
+    role_counts = filtered_df.groupby(["location_clean", "primary_role"], observed=True, sort=False).size()
+    if not role_counts.empty:
+        if len(role_counts) > 20:
+            # Partial sort: only the 20 largest groups need ordering.
+            role_counts = role_counts.iloc[np.argpartition(-role_counts.to_numpy(), 20)[:20]]
+        top_roles = role_counts.sort_values(ascending=False).reset_index(name="Count")
         st.bar_chart(top_roles.set_index("primary_role")["Count"])
 
 # === Top Cities and States ===
@@ -137,19 +272,17 @@ if "primary_role" in df.columns and "location_clean" in df.columns:
 st.markdown("### 🗺️ Top Cities and States by Record Count")
 col1, col2 = st.columns(2)
 
+# One groupby serves both panels; dropna=False keeps cities whose state is missing (and vice versa).
+location_cols = [c for c in ("state", "city") if c in filtered_df.columns]
+if location_cols:
+    location_counts = filtered_df.groupby(location_cols, observed=True, sort=False, dropna=False).size()
+
 with col1:
     st.markdown("#### 🏙️ Top Cities")
     if "city" in filtered_df.columns:
-        non_null_cities = filtered_df["city"].dropna()
-        if not non_null_cities.empty:
-            top_cities = (
-                non_null_cities
-                .value_counts()
-                .rename_axis("City")
-                .reset_index(name="Count")
-                .head(10)
-            )
-            st.dataframe(top_cities)
+        top_cities = location_counts.groupby(level="city", observed=True).sum().nlargest(10)
+        if not top_cities.empty:
+            st.dataframe(top_cities.rename_axis("City").reset_index(name="Count"))
         else:
             st.warning("ℹ️ No non-null city data available for this filtered view.")
     else:
@@ -158,16 +291,9 @@ with col1:
 with col2:
     st.markdown("#### 🗽 Top States")
     if "state" in filtered_df.columns:
-        non_null_states = filtered_df["state"].dropna()
-        if not non_null_states.empty:
-            top_states = (
-                non_null_states
-                .value_counts()
-                .rename_axis("State")
-                .reset_index(name="Count")
-                .head(10)
-            )
-            st.dataframe(top_states)
+        top_states = location_counts.groupby(level="state", observed=True).sum().nlargest(10)
+        if not top_states.empty:
+            st.dataframe(top_states.rename_axis("State").reset_index(name="Count"))
         else:
             st.warning("ℹ️ No non-null state data available for this filtered view.")
     else:
@@ -176,4 +302,4 @@ with col2:
 
 # === Download Button ===
 st.markdown("### 📥 Download Filtered Data")
-st.download_button("Download CSV", data=filtered_df.to_csv(index=False), file_name="filtered_icp_data.csv")
+st.download_button("Download CSV", data=to_csv_bytes(filtered_df, view_key + (sort_column, sort_ascending)), file_name="filtered_icp_data.csv")
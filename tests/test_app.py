@@ -0,0 +1,35 @@
+from pathlib import Path
+
+import pytest
+
+st = pytest.importorskip("streamlit")
+AppTest = pytest.importorskip("streamlit.testing.v1").AppTest
+
+APP_PATH = str(Path(__file__).resolve().parents[1] / "app.py")
+
+CSV = """cleaned_roles,gpt_industry,Aggregated Location,state,city,primary_role,pool_size,PC URL,industries_clean
+Sales Manager,Retail,"Austin, TX",TX,Austin,Sales,12,http://example.com/a,retail
+Software Engineer,Software,Remote,,,Engineer,5,,software
+Account Executive,Retail,"Denver, CO",CO,Denver,Sales,12,not-a-link,retail
+"""
+
+
+def run_app():
+    st.cache_data.clear()
+    at = AppTest.from_file(APP_PATH, default_timeout=30).run()
+    assert not at.exception
+    assert not at.error
+    assert not at.warning
+    return at
+
+
+def test_default_file_loads_twice(tmp_path, monkeypatch):
+    csv_path = tmp_path / "icp.csv"
+    csv_path.write_text(CSV)
+    monkeypatch.setenv("ICP_DEFAULT_FILE", str(csv_path))
+
+    run_app()
+    assert (tmp_path / "icp.csv.parquet").exists()
+
+    # The second cold start reads the Parquet sidecar, including categorical columns with nulls.
+    run_app()